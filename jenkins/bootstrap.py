@@ -40,6 +40,10 @@ The contract with the runner is as follows:
 
 import argparse
 import contextlib
+import errno
+import fcntl
+import gzip
+import hashlib
 import json
 import logging
 import os
@@ -52,24 +56,50 @@ import socket
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 import urllib2
 
+try:
+    # Optional: C-extension JSON parser, noticeably faster on the bigger
+    # payloads (result caches, job config). Serialization stays on the
+    # stdlib so uploaded JSON keeps its exact indent=2 format.
+    import ujson
+    json_loads = ujson.loads  # pylint: disable=invalid-name
+except ImportError:
+    json_loads = json.loads  # pylint: disable=invalid-name
+
 ORIG_CWD = os.getcwd()  # Checkout changes cwd
 
 
-def read_all(end, stream, append):
-    """Read all buffered lines from a stream."""
+def read_all(end, fdesc, tails, append):
+    """Drain a nonblocking pipe in 64KiB chunks, emitting complete lines.
+
+    Bulk os.read() plus one split() per chunk keeps the per-line Python
+    work constant for chatty subprocesses, unlike readline() which scans
+    for the newline a line at a time. Partial trailing lines are kept in
+    tails[fdesc] until the next chunk (or EOF) completes them."""
     while not end or time.time() < end:
-        line = stream.readline()
-        if not line:
+        try:
+            data = os.read(fdesc, 65536)
+        except OSError as exc:
+            if exc.errno == errno.EAGAIN:
+                return False  # Cleared buffer but not at the end
+            raise
+        if not data:
+            if tails.get(fdesc):  # Last line of output may not have a \n
+                append(tails[fdesc])
+                tails[fdesc] = ''
             return True  # Read everything
-        # Strip \n at the end if any. Last line of file may not have one.
-        append(line.rstrip('\n'))
-        # Is there more on the buffer?
-        ret = select.select([stream.fileno()], [], [], 0.1)
-        if not ret[0]:
-            return False  # Cleared buffer but not at the end
+        if fdesc not in tails:
+            # Raw capture: the caller joins the chunks itself, so skip the
+            # per-line splitting (and logging) entirely.
+            append(data)
+            continue
+        lines = (tails[fdesc] + data).split('\n')
+        tails[fdesc] = lines.pop()
+        for line in lines:
+            append(line)
     return False  # Time expired
 
 
@@ -95,6 +125,43 @@ def terminate(end, proc, kill):
     return True
 
 
+def _communicate(proc, stdin, end):
+    """Feed stdin to proc and drain it with communicate().
+
+    communicate() interleaves stdin writes with stdout/stderr reads in the
+    largest chunks the pipes accept, so a child filling its output pipe while
+    we still owe it input cannot deadlock the pair. Timers enforce the
+    deadline the streaming loop checks inline."""
+    timed_out = []
+    timers = []
+    if end:
+        def expire(kill):
+            timed_out.append(True)
+            try:
+                if kill:  # Process will not die, kill everything
+                    os.killpg(os.getpgid(proc.pid), signal.SIGKILL)
+                    proc.kill()
+                else:
+                    proc.terminate()
+            except OSError:  # Already gone
+                pass
+        delay = max(end - time.time(), 0)
+        # Give the subprocess some cleanup time before killing.
+        timers = [
+            threading.Timer(delay, expire, [False]),
+            threading.Timer(delay + 15 * 60, expire, [True]),
+        ]
+        for timer in timers:
+            timer.daemon = True
+            timer.start()
+    try:
+        out, err = proc.communicate(stdin)
+    finally:
+        for timer in timers:
+            timer.cancel()
+    return out, err, bool(timed_out)
+
+
 def _call(end, cmd, stdin=None, check=True, output=None, log_failures=True, env=None):  # pylint: disable=too-many-locals
     """Start a subprocess."""
     logging.info('Call:  %s', ' '.join(pipes.quote(c) for c in cmd))
@@ -109,32 +176,51 @@ def _call(end, cmd, stdin=None, check=True, output=None, log_failures=True, env=
         preexec_fn=os.setsid,
         env=env,
     )
-    if stdin:
-        proc.stdin.write(stdin)
-        proc.stdin.close()
-    out = []
-    code = None
-    timeout = False
-    reads = {
-        proc.stderr.fileno(): (proc.stderr, logging.warning),
-        proc.stdout.fileno(): (
-            proc.stdout, (out.append if output else logging.info)),
-    }
-    while reads:
-        if terminate(end, proc, timeout):
-            if timeout:  # We killed everything
-                break
-            # Give subprocess some cleanup time before killing.
-            end = time.time() + 15 * 60
-            timeout = True
-        ret = select.select(reads, [], [], 0.1)
-        for fdesc in ret[0]:
-            if read_all(end, *reads[fdesc]):
-                reads.pop(fdesc)
-        if not ret[0] and proc.poll() is not None:
-            break  # process exited without closing pipes (timeout?)
-
-    code = proc.wait()
+    if stdin is not None:
+        # Commands fed via stdin do not need their output streamed line by
+        # line as it happens, so let communicate() do the pumping and log
+        # after the fact.
+        out_data, err_data, timeout = _communicate(proc, stdin, end)
+        for line in err_data.splitlines():
+            logging.warning(line)
+        if not output:
+            for line in out_data.splitlines():
+                logging.info(line)
+        lines = output and out_data
+        code = proc.returncode
+    else:
+        out = []
+        timeout = False
+        reads = {
+            proc.stderr.fileno(): logging.warning,
+            proc.stdout.fileno(): out.append if output else logging.info,
+        }
+        # Captured stdout is collected as raw chunks and joined below, so
+        # only the line-logged pipes need a partial-line tail buffer.
+        tails = dict.fromkeys(reads, '')
+        if output:
+            del tails[proc.stdout.fileno()]
+        for fdesc in reads:
+            flags = fcntl.fcntl(fdesc, fcntl.F_GETFL)
+            fcntl.fcntl(fdesc, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        while reads:
+            if terminate(end, proc, timeout):
+                if timeout:  # We killed everything
+                    break
+                # Give subprocess some cleanup time before killing.
+                end = time.time() + 15 * 60
+                timeout = True
+            # Block until output arrives; wake up occasionally to check the
+            # deadline and for processes which exited without closing pipes.
+            ret = select.select(reads, [], [], 1.0)
+            for fdesc in ret[0]:
+                if read_all(end, fdesc, tails, reads[fdesc]):
+                    reads.pop(fdesc)
+            if not ret[0] and proc.poll() is not None:
+                break  # process exited without closing pipes (timeout?)
+
+        code = proc.wait()
+        lines = output and ''.join(out)
     if timeout:
         code = code or 124
         logging.error('Build timed out')
@@ -143,8 +229,6 @@ def _call(end, cmd, stdin=None, check=True, output=None, log_failures=True, env=
     logging.info(
         'process %d exited with code %d after %.1fm',
         proc.pid, code, elapsed(begin))
-    out.append('')
-    lines = output and '\n'.join(out)
     if check and code:
         raise subprocess.CalledProcessError(code, cmd, lines)
     return lines
@@ -238,6 +322,29 @@ def commit_date(git, commit, call):
         return None
 
 
+def borrow_mirror_objects(repo, repo_path):
+    """Borrow objects from a pre-seeded local mirror of repo, if one exists.
+
+    Workers can ship a bare mirror under $HOME/.gitcache (populated out of
+    band, e.g. baked into the image). Pointing the fresh clone's alternates
+    file at it means fetch only transfers the commits the mirror lacks,
+    instead of the repo's full history."""
+    home = os.environ.get(HOME_ENV)
+    if not home:
+        return
+    mirror = os.path.join(home, '.gitcache', '%s.git' % repo, 'objects')
+    if not os.path.isdir(mirror):
+        return
+    alternates = os.path.join(
+        repo_path, '.git', 'objects', 'info', 'alternates')
+    try:
+        with open(alternates, 'w') as fp:
+            fp.write('%s\n' % mirror)
+        logging.info('Borrowing git objects from %s', mirror)
+    except IOError as exc:
+        logging.info('cannot use git mirror %s, continue : %s', mirror, exc)
+
+
 def checkout(call, repo, repo_path, branch, pull, ssh='', git_cache='', clean=False):
     """Fetch and checkout the repository at the specified branch/pull.
 
@@ -270,6 +377,7 @@ def checkout(call, repo, repo_path, branch, pull, ssh='', git_cache='', clean=Fa
         call(['rm', '-f', '%s/index.lock' % cache_dir])
     else:
         call([git, 'init', repo_path])
+        borrow_mirror_objects(repo, repo_path)
     os.chdir(repo_path)
 
     if clean:
@@ -283,6 +391,9 @@ def checkout(call, repo, repo_path, branch, pull, ssh='', git_cache='', clean=Fa
     retries = 3
     for attempt in range(retries):
         try:
+            # --tags is required: the refspecs here have no destination, so
+            # git stores only FETCH_HEAD and does not auto-follow tags, and
+            # hack/lib/version.sh needs tags for git describe.
             call([git, 'fetch', '--quiet', '--tags', repository(repo, ssh)] + refs)
             break
         except subprocess.CalledProcessError as cpe:
@@ -342,18 +453,28 @@ def start(gsutil, paths, stamp, node_name, version, repos):
 class GSUtil(object):
     """A helper class for making gsutil commands."""
     gsutil = 'gsutil'
+    # Every gsutil call forks a fresh Python interpreter that re-imports its
+    # world and re-reads config; disabling the periodic software-update check
+    # at least keeps startup from adding an extra HTTP round trip on top.
+    common_opts = ['-o', 'GSUtil:software_update_check_period=0']
+    # Tune gsutil parallelism so large/multi-file transfers spread across
+    # threads and processes instead of uploading serially.
+    parallel_opts = [
+        '-o', 'GSUtil:parallel_process_count=16',
+        '-o', 'GSUtil:parallel_thread_count=16',
+    ]
 
     def __init__(self, call):
         self.call = call
 
     def stat(self, path):
         """Return metadata about the object, such as generation."""
-        cmd = [self.gsutil, 'stat', path]
+        cmd = [self.gsutil] + self.common_opts + ['stat', path]
         return self.call(cmd, output=True, log_failures=False)
 
     def ls(self, path):
         """List a bucket or subdir."""
-        cmd = [self.gsutil, 'ls', path]
+        cmd = [self.gsutil] + self.common_opts + ['ls', path]
         return self.call(cmd, output=True)
 
     def upload_json(self, path, jdict, generation=None):
@@ -365,16 +486,30 @@ class GSUtil(object):
         with tempfile.NamedTemporaryFile(prefix='gsutil_') as fp:
             fp.write(json.dumps(jdict, indent=2))
             fp.flush()
-            cmd = [
-                self.gsutil, '-q',
+            cmd = [self.gsutil] + self.common_opts + [
+                '-q',
                 '-h', 'Content-Type:application/json'] + gen + [
                 'cp', fp.name, path]
             self.call(cmd)
 
     def copy_file(self, dest, orig, compress):
         """Copy the file to the specified path using compressed encoding."""
-        compress = ['-Z'] if compress else []
-        cmd = [self.gsutil, '-q', 'cp'] + compress + [orig, dest]
+        # No -m here: a single file only splits across workers as a
+        # composite upload, which breaks downloads for consumers without
+        # crcmod, so this stays a single-stream transfer.
+        if compress and os.path.isfile('%s.gz' % orig):
+            # A gzipped mirror was written while the job ran, so the upload
+            # only pays for the transfer instead of re-reading and gzipping
+            # the whole log at the tail of the build.
+            cmd = [self.gsutil] + self.common_opts + [
+                '-q',
+                '-h', 'Content-Type:text/plain',
+                '-h', 'Content-Encoding:gzip',
+                'cp', '%s.gz' % orig, dest]
+        else:
+            compress = ['-Z'] if compress else []
+            cmd = [self.gsutil] + self.common_opts + [
+                '-q', 'cp'] + compress + [orig, dest]
         self.call(cmd)
 
     def upload_text(self, path, txt, additional_headers=None, cached=True):
@@ -387,12 +522,13 @@ class GSUtil(object):
         with tempfile.NamedTemporaryFile(prefix='gsutil_') as fp:
             fp.write(txt)
             fp.flush()
-            cmd = [self.gsutil, '-q'] + headers + ['cp', fp.name, path]
+            cmd = [self.gsutil] + self.common_opts + ['-q'] + headers + ['cp', fp.name, path]
             self.call(cmd)
 
     def cat(self, path, generation):
         """Return contents of path#generation"""
-        cmd = [self.gsutil, '-q', 'cat', '%s#%s' % (path, generation)]
+        cmd = [self.gsutil] + self.common_opts + [
+            '-q', 'cat', '%s#%s' % (path, generation)]
         return self.call(cmd, output=True)
 
     def upload_artifacts(self, gsutil, path, artifacts):
@@ -419,6 +555,14 @@ class GSUtil(object):
         cmd = [
             self.gsutil, '-m', '-q',
             '-o', 'GSUtil:use_magicfile=True',
+            # Skip the up-front work-estimation pass so transfers start
+            # immediately; trees with thousands of tiny logs/reports pay for
+            # that extra walk without benefiting from the estimate.
+            '-o', 'GSUtil:task_estimation_threshold=0',
+        ] + self.common_opts + self.parallel_opts + [
+            # -z gzips inside each -m worker, so compression already runs in
+            # parallel across files. Precompressing to .gz files locally would
+            # rename every artifact, which consumers match by name.
             'cp', '-r', '-c', '-z', 'log,txt,xml',
             artifacts, path,
         ]
@@ -446,7 +590,7 @@ def append_result(gsutil, path, build, version, passed):
             gen = 0
         if gen:
             try:
-                cache = json.loads(gsutil.cat(path, gen))
+                cache = json_loads(gsutil.cat(path, gen))
                 if not isinstance(cache, list):
                     raise ValueError(cache)
             except ValueError as exc:
@@ -477,14 +621,21 @@ def metadata(repos, artifacts, call):
     """Return metadata associated for the build, including inside artifacts."""
     path = os.path.join(artifacts or '', 'metadata.json')
     meta = None
-    if os.path.isfile(path):
-        try:
-            with open(path) as fp:
-                meta = json.loads(fp.read())
-        except (IOError, ValueError):
-            logging.warning('Failed to open %s', path)
-    else:
+    try:
+        # Open then fstat the descriptor: one stat of the path instead of
+        # the isfile/getsize/open triple probing it three times.
+        with open(path) as fp:
+            # Parse straight from the file object; json.loads(fp.read())
+            # would hold a second full copy of the data in memory. Refuse
+            # pathologically large files outright.
+            if os.fstat(fp.fileno()).st_size < 16 * 1024 * 1024:
+                meta = json.load(fp)
+            else:
+                logging.warning('metadata path %s is too large', path)
+    except (IOError, OSError):
         logging.warning('metadata path %s does not exist', path)
+    except ValueError:
+        logging.warning('Failed to open %s', path)
 
     if not meta or not isinstance(meta, dict):
         logging.warning(
@@ -529,24 +680,51 @@ def finish(gsutil, paths, success, artifacts, build, version, repos, call):
         repo: the target repo
     """
 
-    if os.path.isdir(artifacts) and any(f for _, _, f in os.walk(artifacts)):
+    # Collect metadata before the artifact upload starts: upload_artifacts
+    # may rename the local artifacts dir to match the remote one, so a
+    # concurrent read of artifacts/metadata.json would race it.
+    meta = metadata(repos, artifacts, call)
+
+    threads = []
+
+    def upload_artifacts():
         try:
             gsutil.upload_artifacts(gsutil, paths.artifacts, artifacts)
         except subprocess.CalledProcessError:
             logging.warning('Failed to upload artifacts')
+
+    if os.path.isdir(artifacts) and any(f for _, _, f in os.walk(artifacts)):
+        # The artifacts rsync is the slowest part of finish(); overlap it
+        # with the result cache updates, which only touch gs:// objects.
+        # Joined before finished.json is written.
+        thread = threading.Thread(target=upload_artifacts)
+        thread.start()
+        threads.append(thread)
     else:
         logging.warning('Missing local artifacts : %s', artifacts)
 
-    meta = metadata(repos, artifacts, call)
     if not version:
         version = meta.get('job-version')
     if not version:  # TODO(fejta): retire
         version = meta.get('version')
     # github.com/kubernetes/release/find_green_build depends on append_result()
     # TODO(fejta): reconsider whether this is how we want to solve this problem.
-    append_result(gsutil, paths.result_cache, build, version, success)
-    if paths.pr_result_cache:
-        append_result(gsutil, paths.pr_result_cache, build, version, success)
+    # Each append is a serial stat/cat/upload pipeline of gsutil forks, so run
+    # the job cache and the pr cache updates concurrently. They write to
+    # different objects and each already retries with generation-match
+    # preconditions, so racing them is safe.
+    for cache_path in [paths.result_cache, paths.pr_result_cache]:
+        if not cache_path:
+            continue
+        thread = threading.Thread(
+            target=append_result,
+            args=(gsutil, cache_path, build, version, success))
+        thread.start()
+        threads.append(thread)
+    # Everything must be uploaded before finished.json: consumers treat its
+    # existence as "this build's data is complete".
+    for thread in threads:
+        thread.join()
 
     data = {
         # TODO(fejta): update utils.go in contrib to accept a float
@@ -563,6 +741,10 @@ def finish(gsutil, paths, success, artifacts, build, version, repos, call):
     # Upload the latest build for the job.
     # Do this last, since other tools expect the rest of the data to be
     # published when this file is created.
+    # These two objects never share a destination directory (CI runs only
+    # have one; PR runs split theirs between pull/ and directory/), so
+    # there is no same-directory batch for gsutil cp -I to coalesce and
+    # each upload keeps its own process.
     for path in {paths.latest, paths.pr_latest}:
         if path:
             try:
@@ -576,21 +758,31 @@ def test_infra(*paths):
     return os.path.join(ORIG_CWD, os.path.dirname(__file__), '..', *paths)
 
 
+_NODE_PROBE = []  # memoized (node, pod) pair from the first hostname probe
+
+
 def node():
     """Return the name of the node running the build."""
     # TODO(fejta): jenkins sets the node name and our infra expect this value.
     # TODO(fejta): Consider doing something different here.
     if NODE_ENV not in os.environ:
-        host = socket.gethostname().split('.')[0]
-        try:
-            # Try reading the name of the VM we're running on, using the
-            # metadata server.
-            os.environ[NODE_ENV] = urllib2.urlopen(urllib2.Request(
-                'http://169.254.169.254/computeMetadata/v1/instance/name',
-                headers={'Metadata-Flavor': 'Google'})).read()
-            os.environ[POD_ENV] = host  # We also want to log this.
-        except IOError:  # Fallback.
-            os.environ[NODE_ENV] = host
+        if not _NODE_PROBE:
+            # gethostname() may block on a misconfigured resolver and the
+            # metadata request is a network round trip, so only probe once.
+            host = socket.gethostname().split('.')[0]
+            try:
+                # Try reading the name of the VM we're running on, using the
+                # metadata server.
+                name = urllib2.urlopen(urllib2.Request(
+                    'http://169.254.169.254/computeMetadata/v1/instance/name',
+                    headers={'Metadata-Flavor': 'Google'})).read()
+                _NODE_PROBE.append((name, host))
+            except IOError:  # Fallback.
+                _NODE_PROBE.append((host, None))
+        name, pod = _NODE_PROBE[0]
+        os.environ[NODE_ENV] = name
+        if pod is not None:
+            os.environ[POD_ENV] = pod  # We also want to log this.
     return os.environ[NODE_ENV]
 
 
@@ -599,10 +791,12 @@ def find_version(call):
     # TODO(fejta): once job-version is functional switch this to
     # git rev-parse [--short=N] HEAD^{commit}
     version_file = 'version'
-    if os.path.isfile(version_file):
+    try:
         # e2e tests which download kubernetes use this path:
         with open(version_file) as fp:
             return fp.read().strip()
+    except IOError:
+        pass
 
     version_script = 'hack/lib/version.sh'
     if os.path.isfile(version_script):
@@ -652,18 +846,22 @@ class Paths(object):  # pylint: disable=too-many-instance-attributes,too-few-pub
 
 def ci_paths(base, job, build):
     """Return a Paths() instance for a continuous build."""
-    latest = os.path.join(base, job, 'latest-build.txt')
+    # These are gs:// urls rather than real filesystem paths, so build each
+    # one with a single interpolation of the shared prefixes instead of a
+    # chain of os.path.join calls.
+    job_path = '%s/%s' % (base, job)
+    build_path = '%s/%s' % (job_path, build)
     return Paths(
-        artifacts=os.path.join(base, job, build, 'artifacts'),
-        build_log=os.path.join(base, job, build, 'build-log.txt'),
+        artifacts='%s/artifacts' % build_path,
+        build_log='%s/build-log.txt' % build_path,
         pr_path=None,
-        finished=os.path.join(base, job, build, 'finished.json'),
-        latest=latest,
+        finished='%s/finished.json' % build_path,
+        latest='%s/latest-build.txt' % job_path,
         pr_build_link=None,
         pr_latest=None,
         pr_result_cache=None,
-        result_cache=os.path.join(base, job, 'jobResultsCache.json'),
-        started=os.path.join(base, job, build, 'started.json'),
+        result_cache='%s/jobResultsCache.json' % job_path,
+        started='%s/started.json' % build_path,
     )
 
 
@@ -685,26 +883,25 @@ def pr_paths(base, repos, job, build):
         prefix = repo.replace('/', '_')
     # Batch merges are those with more than one PR specified.
     pr_nums = pull_numbers(pull)
-    if len(pr_nums) > 1:
-        pull = os.path.join(prefix, 'batch')
-    else:
-        pull = os.path.join(prefix, pr_nums[0])
-    pr_path = os.path.join(base, 'pull', pull, job, build)
-    result_cache = os.path.join(
-        base, 'directory', job, 'jobResultsCache.json')
-    pr_result_cache = os.path.join(
-        base, 'pull', pull, job, 'jobResultsCache.json')
+    pull = 'batch' if len(pr_nums) > 1 else pr_nums[0]
+    if prefix:
+        pull = '%s/%s' % (prefix, pull)
+    # These are gs:// urls rather than real filesystem paths; interpolate the
+    # shared prefixes once instead of os.path.join-ing every component.
+    pr_job = '%s/pull/%s/%s' % (base, pull, job)
+    pr_path = '%s/%s' % (pr_job, build)
+    dir_job = '%s/directory/%s' % (base, job)
     return Paths(
-        artifacts=os.path.join(pr_path, 'artifacts'),
-        build_log=os.path.join(pr_path, 'build-log.txt'),
+        artifacts='%s/artifacts' % pr_path,
+        build_log='%s/build-log.txt' % pr_path,
         pr_path=pr_path,
-        finished=os.path.join(pr_path, 'finished.json'),
-        latest=os.path.join(base, 'directory', job, 'latest-build.txt'),
-        pr_build_link=os.path.join(base, 'directory', job, '%s.txt' % build),
-        pr_latest=os.path.join(base, 'pull', pull, job, 'latest-build.txt'),
-        pr_result_cache=pr_result_cache,
-        result_cache=result_cache,
-        started=os.path.join(pr_path, 'started.json'),
+        finished='%s/finished.json' % pr_path,
+        latest='%s/latest-build.txt' % dir_job,
+        pr_build_link='%s/%s.txt' % (dir_job, build),
+        pr_latest='%s/latest-build.txt' % pr_job,
+        pr_result_cache='%s/jobResultsCache.json' % pr_job,
+        result_cache='%s/jobResultsCache.json' % dir_job,
+        started='%s/started.json' % pr_path,
     )
 
 
@@ -742,6 +939,18 @@ def build_name(started):
     return os.environ[BUILD_ENV]
 
 
+_ACTIVATED_KEYS = set()  # fingerprints of keys this process has activated
+
+
+def key_fingerprint(key_file):
+    """Return a fingerprint of the credential file, or None if unreadable."""
+    try:
+        with open(key_file, 'rb') as fp:
+            return hashlib.sha1(fp.read()).hexdigest()
+    except IOError:
+        return None
+
+
 def setup_credentials(call, robot, upload):
     """Activate the service account unless robot is none."""
     # TODO(fejta): stop activating inside the image
@@ -762,25 +971,34 @@ def setup_credentials(call, robot, upload):
             'Create service account and then create key at '
             'https://console.developers.google.com/iam-admin/serviceaccounts/project',  # pylint: disable=line-too-long
         )
-    # this sometimes fails spuriously due to DNS flakiness, so we retry it
-    for _ in range(5):
-        try:
-            call([
-                'gcloud',
-                'auth',
-                'activate-service-account',
-                '--key-file=%s' % os.environ[SERVICE_ACCOUNT_ENV],
-            ])
-            break
-        except subprocess.CalledProcessError:
-            pass
-        sleep_for = 1
-        logging.info(
-            'Retrying service account activation in %.2fs ...', sleep_for)
-        time.sleep(sleep_for)
+    fingerprint = key_fingerprint(os.environ[SERVICE_ACCOUNT_ENV])
+    if fingerprint and fingerprint in _ACTIVATED_KEYS:
+        # Activation forks a multi-second gcloud invocation; skip it when
+        # this process already activated this exact key. Keyed on file
+        # content, so a rotated key at the same path still activates.
+        logging.info('Service account already activated, skipping.')
     else:
-        raise Exception(
-            "Failed to activate service account, exhausted retries")
+        # this sometimes fails spuriously due to DNS flakiness, so we retry it
+        for _ in range(5):
+            try:
+                call([
+                    'gcloud',
+                    'auth',
+                    'activate-service-account',
+                    '--key-file=%s' % os.environ[SERVICE_ACCOUNT_ENV],
+                ])
+                break
+            except subprocess.CalledProcessError:
+                pass
+            sleep_for = 1
+            logging.info(
+                'Retrying service account activation in %.2fs ...', sleep_for)
+            time.sleep(sleep_for)
+        else:
+            raise Exception(
+                "Failed to activate service account, exhausted retries")
+        if fingerprint:
+            _ACTIVATED_KEYS.add(fingerprint)
     try:  # Old versions of gcloud may not support this value
         account = call(
             ['gcloud', 'config', 'get-value', 'account'], output=True).strip()
@@ -789,23 +1007,101 @@ def setup_credentials(call, robot, upload):
     logging.info('Will upload results to %s using %s', upload, account)
 
 
-def setup_logging(path):
-    """Initialize logging to screen and path."""
+class FastFormatter(logging.Formatter):
+    """Format [IWEF]mmdd HH:MM:SS.mmm] msg records with minimal overhead.
+
+    The root handlers format every line a job emits, and the stock Formatter
+    re-runs strftime plus a handful of %-substitutions for each record.
+    Consecutive records nearly always share the same wall-clock second, so
+    memoize the second-to-string conversion in a single slot and assemble
+    the rest with one interpolation."""
+
+    def __init__(self):
+        logging.Formatter.__init__(self)
+        self._last = (None, None)
+
+    def format(self, record):
+        sec = int(record.created)
+        last_sec, asctime = self._last
+        if sec != last_sec:
+            asctime = time.strftime(
+                '%m%d %H:%M:%S', self.converter(record.created))
+            self._last = (sec, asctime)
+        msg = '%s%s.%03d] %s' % (
+            record.levelname[0], asctime, record.msecs, record.getMessage())
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            msg = '%s\n%s' % (msg, record.exc_text)
+        return msg
+
+
+class BufferedFileHandler(logging.FileHandler):
+    """FileHandler with a large write buffer.
+
+    The default handler writes each record through to the kernel; a 1MiB
+    buffer turns the build log's many small writes into a few large ones.
+    close() writes out the buffer, and an unclean crash loses at most the
+    buffered tail, which the console handler printed anyway."""
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, 1024 * 1024)
+
+    def flush(self):
+        # emit() flushes after every record, which would drain the buffer
+        # one line at a time and keep the per-line write syscalls; rely on
+        # the buffer filling and on close() instead.
+        pass
+
+
+class GzipFileHandler(logging.FileHandler):
+    """FileHandler which gzips the log as it is written.
+
+    Compressing while the job runs overlaps the gzip work with the job
+    itself, so uploading the compressed build log at the end only pays for
+    the transfer instead of re-reading and gzipping a potentially huge file
+    first."""
+
+    def _open(self):
+        return gzip.open(self.baseFilename, self.mode + 'b')
+
+    def flush(self):
+        # emit() flushes after every record, and GzipFile.flush() does a
+        # zlib sync flush which terminates a deflate block per log line,
+        # bloating the output several times over. Let the compressor pick
+        # its own block boundaries; close() still finalizes the stream.
+        pass
+
+
+def setup_logging(path, compress=False):
+    """Initialize logging to screen and path, optionally gzipping a mirror."""
     # See https://docs.python.org/2/library/logging.html#logrecord-attributes
     # [IWEF]mmdd HH:MM:SS.mmm] msg
     fmt = '%(levelname).1s%(asctime)s.%(msecs)03d] %(message)s'  # pylint: disable=line-too-long
     datefmt = '%m%d %H:%M:%S'
+    # The format uses none of the record attributes that are expensive to
+    # collect, so skip the per-record stack walk for filename/lineno and the
+    # thread/process lookups entirely.
+    logging._srcfile = None  # pylint: disable=protected-access
+    logging.logThreads = 0
+    logging.logProcesses = 0
+    logging.logMultiprocessing = 0
     logging.basicConfig(
         level=logging.INFO,
         format=fmt,
         datefmt=datefmt,
     )
-    build_log = logging.FileHandler(filename=path, mode='w')
-    build_log.setLevel(logging.INFO)
-    formatter = logging.Formatter(fmt, datefmt=datefmt)
-    build_log.setFormatter(formatter)
-    logging.getLogger('').addHandler(build_log)
-    return build_log
+    formatter = FastFormatter()
+    for console in logging.getLogger('').handlers:
+        console.setFormatter(formatter)
+    handlers = [BufferedFileHandler(filename=path, mode='w')]
+    if compress:
+        handlers.append(GzipFileHandler(filename='%s.gz' % path, mode='w'))
+    for build_log in handlers:
+        build_log.setLevel(logging.INFO)
+        build_log.setFormatter(formatter)
+        logging.getLogger('').addHandler(build_log)
+    return handlers
 
 
 def get_artifacts_dir():
@@ -871,12 +1167,13 @@ def setup_magic_environment(job, call):
         os.getenv(WORKSPACE_ENV, os.getcwd()), '_artifacts')
 
     # also make the artifacts dir if it doesn't exist yet
-    if not os.path.isdir(get_artifacts_dir()):
+    artifacts_dir = get_artifacts_dir()
+    if not os.path.isdir(artifacts_dir):
         try:
-            os.makedirs(get_artifacts_dir())
+            os.makedirs(artifacts_dir)
         except OSError as exc:
             logging.info(
-                'cannot create %s, continue : %s', get_artifacts_dir(), exc)
+                'cannot create %s, continue : %s', artifacts_dir, exc)
 
     # Try to set SOURCE_DATE_EPOCH based on the commit date of the tip of the
     # tree.
@@ -894,7 +1191,7 @@ def job_args(args):
 def job_script(job, scenario, extra_job_args):
     """Return path to script for job."""
     with open(test_infra('jobs/config.json')) as fp:
-        config = json.loads(fp.read())
+        config = json_loads(fp.read())
     if job.startswith('pull-security-kubernetes-'):
         job = job.replace('pull-security-kubernetes-', 'pull-kubernetes-', 1)
     config_json_args = []
@@ -1043,9 +1340,14 @@ def bootstrap(args):
     job = args.job
     repos = parse_repos(args)
     upload = args.upload
+    if args.service_account:
+        # Resolve before any chdir so credential activation can run while
+        # setup_root changes directories underneath it.
+        args.service_account = os.path.abspath(args.service_account)
 
     build_log_path = os.path.abspath('build-log.txt')
-    build_log = setup_logging(build_log_path)
+    build_logs = setup_logging(
+        build_log_path, compress=bool(args.compress and upload))
     started = time.time()
     if args.timeout:
         end = started + args.timeout * 60
@@ -1091,9 +1393,27 @@ def bootstrap(args):
 
     try:
         with configure_ssh_key(args.ssh):
-            setup_credentials(call, args.service_account, upload)
-            setup_root(call, args.root, repos, args.ssh,
-                       args.git_cache, args.clean)
+            # Activating the service account is a multi-second gcloud fork
+            # spent waiting on the network, with no data dependency on the
+            # checkout, so overlap it with setup_root. Errors surface after
+            # the join, credential failures first, preserving the order the
+            # old sequential code raised them in.
+            creds_exc = []
+
+            def activate_credentials():
+                try:
+                    setup_credentials(call, args.service_account, upload)
+                except Exception:  # pylint: disable=broad-except
+                    creds_exc.append(sys.exc_info())
+            creds_thread = threading.Thread(target=activate_credentials)
+            creds_thread.start()
+            try:
+                setup_root(call, args.root, repos, args.ssh,
+                           args.git_cache, args.clean)
+            finally:
+                creds_thread.join()
+                if creds_exc:
+                    raise creds_exc[0][0], creds_exc[0][1], creds_exc[0][2]  # pylint: disable=raising-bad-type
             logging.info('Configure environment...')
             setup_magic_environment(job, call)
             setup_credentials(call, args.service_account, upload)
@@ -1125,8 +1445,9 @@ def bootstrap(args):
             )
         except subprocess.CalledProcessError:  # Still try to upload build log
             success = False
-    logging.getLogger('').removeHandler(build_log)
-    build_log.close()
+    for build_log in build_logs:
+        logging.getLogger('').removeHandler(build_log)
+        build_log.close()
     if upload:
         gsutil.copy_file(paths.build_log, build_log_path, args.compress)
     if exc_type:
@@ -19,11 +19,15 @@
 # pylint: disable=protected-access, attribute-defined-outside-init
 
 import argparse
+import fcntl
+import gzip
 import json
+import logging
 import os
-import select
+import shutil
 import signal
 import subprocess
+import sys
 import tempfile
 import time
 import unittest
@@ -104,50 +108,64 @@ def Bomb(*a, **kw):
 class ReadAllTest(unittest.TestCase):
     endless = 0
     ended = time.time() - 50
-    number = 0
-    end = -1
 
-    def fileno(self):
-        return self.end
+    def setUp(self):
+        self.reader, self.writer = os.pipe()
+        flags = fcntl.fcntl(self.reader, fcntl.F_GETFL)
+        fcntl.fcntl(self.reader, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self.tails = {self.reader: ''}
 
-    def readline(self):
-        line = 'line %d\n' % self.number
-        self.number += 1
-        return line
+    def tearDown(self):
+        for fdesc in (self.reader, self.writer):
+            try:
+                os.close(fdesc)
+            except OSError:
+                pass
 
     def test_read_more(self):
         """Read lines until we clear the buffer, noting there may be more."""
         lines = []
-        total = 10
-        def more_lines(*_a, **_kw):
-            if len(lines) < total:
-                return [self], [], []
-            return [], [], []
-        with Stub(select, 'select', more_lines):
-            done = bootstrap.read_all(self.endless, self, lines.append)
+        os.write(self.writer, 'line 0\nline 1\npartial')
+        done = bootstrap.read_all(self.endless, self.reader, self.tails, lines.append)
 
         self.assertFalse(done)
-        self.assertEqual(total, len(lines))
-        expected = ['line %d' % d for d in range(total)]
-        self.assertEqual(expected, lines)
+        self.assertEqual(['line 0', 'line 1'], lines)
+        self.assertEqual('partial', self.tails[self.reader])
+
+        os.write(self.writer, ' line\n')
+        done = bootstrap.read_all(self.endless, self.reader, self.tails, lines.append)
+
+        self.assertFalse(done)
+        self.assertEqual(['line 0', 'line 1', 'partial line'], lines)
+
+    def test_read_raw(self):
+        """Capture raw chunks without line splitting when there is no tail."""
+        chunks = []
+        os.write(self.writer, 'line 0\npartial')
+        os.close(self.writer)
+        done = bootstrap.read_all(self.endless, self.reader, {}, chunks.append)
+
+        self.assertTrue(done)
+        self.assertEqual('line 0\npartial', ''.join(chunks))
 
     def test_read_expired(self):
         """Read nothing as we are expired, noting there may be more."""
         lines = []
-        with Stub(select, 'select', lambda *a, **kw: ([], [], [])):
-            done = bootstrap.read_all(self.ended, self, lines.append)
+        os.write(self.writer, 'unread\n')
+        done = bootstrap.read_all(self.ended, self.reader, self.tails, lines.append)
 
         self.assertFalse(done)
         self.assertFalse(lines)
 
     def test_read_end(self):
-        """Note we reached the end of the stream."""
+        """Note we reached the end of the stream, flushing any partial line."""
         lines = []
-        with Stub(select, 'select', lambda *a, **kw: ([self], [], [])):
-            with Stub(self, 'readline', lambda: ''):
-                done = bootstrap.read_all(self.endless, self, lines.append)
+        os.write(self.writer, 'last line')
+        os.close(self.writer)
+        done = bootstrap.read_all(self.endless, self.reader, self.tails, lines.append)
 
         self.assertTrue(done)
+        self.assertEqual(['last line'], lines)
 
 
 class TerminateTest(unittest.TestCase):
@@ -399,6 +417,26 @@ class CheckoutTest(unittest.TestCase):
             'FETCH_HEAD' in cmd for cmd, _, _ in fake.calls
             if 'checkout' in cmd))
 
+    def test_mirror(self):
+        """checkout borrows objects from a pre-seeded local mirror."""
+        fake = FakeCall()
+        tmp = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(
+                tmp, '.gitcache', '%s.git' % REPO, 'objects'))
+            repo_path = os.path.join(tmp, 'workspace', REPO)
+            info = os.path.join(repo_path, '.git', 'objects', 'info')
+            os.makedirs(info)
+            env = fake_environment(**{bootstrap.HOME_ENV: tmp})
+            with Stub(os, 'chdir', Pass):
+                with Stub(os, 'environ', env):
+                    bootstrap.checkout(fake, REPO, repo_path, BRANCH, None)
+            alternates = os.path.join(info, 'alternates')
+            self.assertTrue(os.path.isfile(alternates))
+            self.assertIn('.gitcache', open(alternates).read())
+        finally:
+            shutil.rmtree(tmp)
+
     def test_repo_path(self):
         """checkout repo to different local path."""
         fake = FakeSubprocess()
@@ -532,6 +570,63 @@ class GSUtilTest(unittest.TestCase):
         self.assertTrue(any('foo: bar' in a for a in fake.calls[0][0]))
         self.assertEqual(fake.file_data, ['path'])
 
+class FastFormatterTest(unittest.TestCase):
+    """Tests for FastFormatter."""
+
+    def test_matches_stock_formatter(self):
+        fmt = '%(levelname).1s%(asctime)s.%(msecs)03d] %(message)s'
+        stock = logging.Formatter(fmt, datefmt='%m%d %H:%M:%S')
+        fast = bootstrap.FastFormatter()
+        record = logging.LogRecord(
+            'root', logging.INFO, 'f.py', 1, 'hello %s', ('world',), None)
+        self.assertEqual(stock.format(record), fast.format(record))
+
+    def test_exception(self):
+        fast = bootstrap.FastFormatter()
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record = logging.LogRecord(
+                'root', logging.ERROR, 'f.py', 1, 'oops', (), sys.exc_info())
+        self.assertIn('oops', fast.format(record))
+        self.assertIn('boom', fast.format(record))
+        self.assertIn('Traceback', fast.format(record))
+
+
+class SetupLoggingTest(unittest.TestCase):
+    """Tests for setup_logging()."""
+
+    def do_setup(self, compress):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'build-log.txt')
+            handlers = bootstrap.setup_logging(path, compress=compress)
+            logging.warning('hello world')
+            for handler in handlers:
+                logging.getLogger('').removeHandler(handler)
+                handler.close()
+            self.assertIn('hello world', open(path).read())
+            return handlers, os.path.isfile('%s.gz' % path), path
+        finally:
+            if os.path.isfile(os.path.join(tmp, 'build-log.txt.gz')):
+                buf = gzip.open(os.path.join(tmp, 'build-log.txt.gz')).read()
+                self.gz_buf = buf
+            shutil.rmtree(tmp)
+
+    def test_plain(self):
+        handlers, has_gz, _ = self.do_setup(False)
+        self.assertEqual(1, len(handlers))
+        self.assertIsInstance(handlers[0], bootstrap.BufferedFileHandler)
+        self.assertFalse(has_gz)
+
+    def test_compress_mirror(self):
+        """A gzipped mirror of the log is written alongside the plain one."""
+        handlers, has_gz, _ = self.do_setup(True)
+        self.assertEqual(2, len(handlers))
+        self.assertTrue(has_gz)
+        self.assertIn('hello world', self.gz_buf)
+
+
 class FakeGSUtil(object):
     generation = 123
 
@@ -885,6 +980,26 @@ class SetupCredentialsTest(unittest.TestCase):
                 bootstrap.setup_credentials(Pass, None, 'gs://fake')
 
 
+    def test_already_activated(self):
+        """Only the first activation of a key forks gcloud."""
+        fdesc, key = tempfile.mkstemp()
+        try:
+            with os.fdopen(fdesc, 'w') as fp:
+                json.dump({'client_email': 'fake-robot@example.com'}, fp)
+            calls = []
+            def call(cmd, output=None):  # pylint: disable=unused-argument
+                calls.append(cmd)
+                return ''
+            with Stub(bootstrap, '_ACTIVATED_KEYS', set()):
+                with Stub(os, 'environ', self.env):
+                    bootstrap.setup_credentials(call, key, UPLOAD)
+                    bootstrap.setup_credentials(call, key, UPLOAD)
+            activations = [
+                cmd for cmd in calls if 'activate-service-account' in cmd]
+            self.assertEqual(1, len(activations))
+        finally:
+            os.unlink(key)
+
     def test_application_credentials(self):
         """Raise if GOOGLE_APPLICATION_CREDENTIALS does not exist."""
         del self.env[bootstrap.SERVICE_ACCOUNT_ENV]
@@ -1031,7 +1146,7 @@ class FakePath(object):
 class FakeLogging(object):
     close = Pass
     def __call__(self, *_a, **_kw):
-        return self
+        return [self]
 
 
 class FakeFinish(object):